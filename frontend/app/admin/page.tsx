@@ -78,7 +78,7 @@ export default function AdminPage() {
     }
 
     // 这里的 role 判断主要是“用户体验层”的拦截（避免普通用户看到管理页）。
-    // 真正的权限控制在后端：管理员接口会校验 X-Student-Id 对应用户的 role。
+    // 真正的权限控制在后端：管理员接口会校验会话 token（或 X-Student-Id）对应的 role。
     if (role !== "admin") {
       router.push("/dashboard");
       return;
@@ -100,12 +100,16 @@ export default function AdminPage() {
 
   const fetchUsersWeapons = (studentId: string) => {
     setUsersLoading(true);
-    fetch("/api/admin/users/weapons", {
-      headers: {
-        // 该 header 用于后端鉴权 & 审计日志；并不等价于安全登录态。
-        "X-Student-Id": studentId,
-      }
-    })
+    const headers: Record<string, string> = {
+      // 该 header 用于后端鉴权 & 审计日志；并不等价于安全登录态。
+      "X-Student-Id": studentId,
+    };
+    // 登录时后端发的会话 token：带上后管理员校验不用再查数据库。
+    const token = localStorage.getItem("session_token");
+    if (token) {
+      headers["X-Session-Token"] = token;
+    }
+    fetch("/api/admin/users/weapons", { headers })
       .then(res => res.json())
       .then(data => {
         if (data.status === "success") {
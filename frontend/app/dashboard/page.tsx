@@ -66,6 +66,7 @@ export default function Dashboard() {
     localStorage.removeItem("student_id");
     localStorage.removeItem("role");
     localStorage.removeItem("is_admin");
+    localStorage.removeItem("session_token");
     router.push("/");
   };
 
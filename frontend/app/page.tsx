@@ -48,6 +48,9 @@ export default function LoginPage() {
       if (typeof data?.user?.is_admin === "boolean") {
         localStorage.setItem("is_admin", String(data.user.is_admin));
       }
+      if (data?.token) {
+        localStorage.setItem("session_token", data.token);
+      }
 
       // 2. 跳转
       router.push("/dashboard");
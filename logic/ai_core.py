@@ -9,11 +9,24 @@
 缓存仅在 Streamlit runtime 存在时启用；其余环境退化为普通函数。
 """
 
+import functools
+import io
 import os
+
+# librosa 的 stft/zcr 等热点函数由 numba @jit(cache=True) 编译；默认缓存写在
+# site-packages 的 __pycache__ 里，容器/只读安装时写不进去，每次重启都要重新编译。
+# 必须在 import librosa（进而 import numba）之前设置才生效。
+os.environ.setdefault(
+    "NUMBA_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".numba_cache"),
+)
+
 import joblib
 import numpy as np
 import librosa
 import pandas as pd
+import soundfile as sf
+import soxr
 try:
     import streamlit as st
     from streamlit.runtime import runtime as st_runtime
@@ -27,7 +40,12 @@ from gradio_client import Client, handle_file
 SAMPLE_RATE = 22050
 DURATION = 2.0
 N_MFCC = 13
+# 特征列顺序：scripts/extract_features.py 按这个顺序写 CSV，训练/推理都依赖它
+FEATURE_NAMES = ["zcr", "rms", "spectral_centroid"] + [f"mfcc_{i}" for i in range(N_MFCC)]
 HF_SPACE_ID = "Corden/pubg-sound-api" # 你的 Space 地址
+# STFT / 分帧参数：沿用 librosa 的默认值（训练特征就是用默认值算的）
+N_FFT = 2048
+HOP_LENGTH = 512
 
 def _cache_resource(func):
     """仅在 Streamlit runtime 下启用 st.cache_resource。
@@ -35,15 +53,37 @@ def _cache_resource(func):
     背景：
     - Streamlit 的缓存对 UI 体验很好（避免重复加载模型/网络客户端）。
     - 但在 FastAPI/pytest 环境下，强依赖 Streamlit runtime 会导致 import 失败。
+
+    非 Streamlit 环境退化为 functools.lru_cache：进程内只算一次。
+    否则 FastAPI 每个 /api/analyze 请求都会重新 joblib.load 一遍模型包。
+    （测试里可以用 .cache_clear() 重置。）
     """
 
     try:
         if st is not None and st_runtime is not None and st_runtime.exists():
             return st.cache_resource(func)
     except Exception:
-        # Fallback to no-op caching outside Streamlit.
         pass
-    return func
+    # Fallback to process-wide memoization outside Streamlit.
+    return functools.lru_cache(maxsize=None)(func)
+
+
+def _cache_data(**cache_kwargs):
+    """仅在 Streamlit runtime 下启用 st.cache_data（可透传 max_entries 等参数）。
+
+    与 _cache_resource 同理：cache_data 适合“输入相同 -> 输出相同”的纯函数，
+    Streamlit 会按参数内容做哈希，rerun 时命中缓存直接返回结果副本。
+    """
+
+    def decorator(func):
+        try:
+            if st is not None and st_runtime is not None and st_runtime.exists():
+                return st.cache_data(**cache_kwargs)(func)
+        except Exception:
+            pass
+        return func
+
+    return decorator
 
 
 @_cache_resource
@@ -69,8 +109,11 @@ def load_local_models():
         print(f"正在尝试加载模型，路径: {model_path}")
 
         if os.path.exists(model_path):
+            # 不用 mmap_mode='r'：sklearn 的 Tree 在反序列化时会把节点数组拷贝进自己的内存，
+            # 内存映射省不下任何读盘/RSS（实测加载耗时与峰值内存都不变）。
             model = joblib.load(model_path)
             print("本地模型加载成功！")
+            _warmup_feature_pipeline()
             return model
         else:
             print("错误：模型文件不存在于该路径。")
@@ -80,6 +123,96 @@ def load_local_models():
         print(f"模型加载发生异常: {e}")
         return None
 
+def _warmup_feature_pipeline():
+    """用一段 DURATION 秒的静音在启动阶段跑一遍特征提取。
+
+    librosa 内部的 numba 函数第一次调用时才做 JIT 编译（实测约 1.5s），
+    放在模型加载（本身只执行一次）时顺手触发，避免第一位上传音频的用户承担这段延迟。
+    静音直接在内存里生成 WAV，不需要额外的样例文件。
+    """
+    buf = io.BytesIO()
+    sf.write(buf, np.zeros(int(SAMPLE_RATE * DURATION), dtype="float32"), SAMPLE_RATE, format="WAV")
+    buf.seek(0)
+    extract_features(buf)
+
+
+def _load_audio(audio_file):
+    """解码音频为单声道 float32，采样率统一到 SAMPLE_RATE，只保留前 DURATION 秒。
+
+    直接用 soundfile（libsndfile，C 实现）解码 + soxr 重采样，
+    跳过 librosa.load 的 Python 层分发；soxr 的 "HQ" 档与 librosa 默认的
+    res_type="soxr_hq" 是同一个算法，保证特征与训练时一致。
+    libsndfile 解不了的格式再退回 librosa.load（内部走 audioread）。
+    """
+    try:
+        with sf.SoundFile(audio_file) as f:
+            orig_sr = f.samplerate
+            y = f.read(frames=int(orig_sr * DURATION), dtype="float32", always_2d=True)
+    except (sf.LibsndfileError, RuntimeError):
+        y, _ = librosa.load(audio_file, sr=SAMPLE_RATE, duration=DURATION)
+        return y
+
+    # 多声道取均值转单声道（与 librosa.to_mono 一致）
+    y = y.mean(axis=1)
+    if orig_sr != SAMPLE_RATE:
+        y = soxr.resample(y, orig_sr, SAMPLE_RATE, quality="HQ")
+    return y[:int(SAMPLE_RATE * DURATION)]
+
+
+def _load_fixed_length(audio_file, out=None):
+    """解码并写入固定长度（SAMPLE_RATE * DURATION）的 float32 缓冲区。
+
+    不足时长的部分天然就是补零，省掉 np.pad 再分配一次数组
+    （与之前 'constant' 补零结果完全一致）。out 可传入批量矩阵的某一行，直接原地写入。
+    """
+    decoded = _load_audio(audio_file)
+    target = int(SAMPLE_RATE * DURATION)
+    if out is None:
+        out = np.zeros(target, dtype=np.float32)
+    n = min(len(decoded), target)
+    out[:n] = decoded[:n]
+    return out
+
+
+# mel 滤波器组 / STFT 频率轴只和 sr、n_fft 有关：导入时算一次复用
+# （librosa.feature.melspectrogram 每次调用都要重建滤波器组，约 1.3ms）。
+_MEL_BASIS = librosa.filters.mel(sr=SAMPLE_RATE, n_fft=N_FFT)
+_FFT_FREQS = librosa.fft_frequencies(sr=SAMPLE_RATE, n_fft=N_FFT)[:, None]
+
+
+def _zero_crossing_rate(y):
+    """与 librosa.feature.zero_crossing_rate(y) 的逐帧结果完全一致，形状 (..., n_frames)。
+
+    librosa 先按帧展开成 (2048, n_frames) 的视图再逐帧判断过零，相邻帧重叠 3/4，
+    同一个采样点会被判断 4 次。这里在整条信号上只判断一次，再用前缀和按帧求和。
+    判定规则照抄 librosa：|x| <= 1e-10 视为 0（不算负数）；每帧第一个采样点不计。
+    """
+    half = N_FFT // 2
+    pad = [(0, 0)] * (y.ndim - 1) + [(half, half)]
+    y = np.pad(y, pad, mode="edge")
+    neg = y < -np.asarray(1e-10, dtype=y.dtype)
+    cross = neg[..., 1:] != neg[..., :-1]          # cross[i] 对应采样点 i+1
+    csum = np.zeros(cross.shape[:-1] + (cross.shape[-1] + 1,), dtype=np.int64)
+    np.cumsum(cross, axis=-1, out=csum[..., 1:])
+    starts = np.arange(1 + (y.shape[-1] - N_FFT) // HOP_LENGTH) * HOP_LENGTH
+    # 帧 [s, s+N_FFT) 内计数的是采样点 s+1 .. s+N_FFT-1，即 cross[s : s+N_FFT-1]
+    counts = csum[..., starts + N_FFT - 1] - csum[..., starts]
+    return counts / N_FFT
+
+
+def _spectral_centroid(mag):
+    """与 librosa.feature.spectral_centroid(S=mag) 的逐帧结果完全一致，形状 (..., n_frames)。
+
+    运算顺序和 librosa 相同（先按列 L1 归一化，再与频率加权求和），只是省掉了
+    它每次调用时的参数校验与 util.normalize 里的整表检查。能量为 0 的帧
+    归一化分母按 librosa 的做法置 1，质心为 0。
+    """
+    # librosa 的分母按 float64 累加，归一化结果再存回 mag 的 dtype（float32），这里照做
+    length = np.sum(mag.astype(np.float64), axis=-2, keepdims=True)
+    length[length < np.finfo(mag.dtype).tiny] = 1.0
+    return np.sum(_FFT_FREQS * (mag / length).astype(mag.dtype), axis=-2)
+
+
 def extract_features(audio_file):
     """提取音频特征（必须与训练时一致）。
 
@@ -91,35 +224,201 @@ def extract_features(audio_file):
     - 不足时长则补零，保证特征维度固定，便于模型推理。
     """
     try:
-        y, sr = librosa.load(audio_file, sr=SAMPLE_RATE, duration=DURATION)
-        if len(y) < SAMPLE_RATE * DURATION:
-            padding = int(SAMPLE_RATE * DURATION) - len(y)
-            y = np.pad(y, (0, padding), 'constant')
+        y = _load_fixed_length(audio_file)
         
-        zcr = np.mean(librosa.feature.zero_crossing_rate(y))
+        # 频谱类特征共用同一次 STFT（librosa 默认 n_fft=2048, hop_length=512），
+        # 避免 spectral_centroid / mfcc 各自重复做一遍 FFT。
+        # ZCR 与 RMS 是时域特征，直接在 y 上算：RMS 若改从频谱推导，
+        # 会因为 Hann 窗的能量衰减而与训练时的数值不一致。
+        # ZCR / 质心 / mel 用上面的 NumPy 版本（结果与 librosa 逐位一致，省掉每次的
+        # 分帧、校验和滤波器组重建）；RMS 在 librosa 里本来就很轻，保持原样。
+        mag = np.abs(librosa.stft(y))
+        zcr = np.mean(_zero_crossing_rate(y))
         rms = np.mean(librosa.feature.rms(y=y))
-        cent = np.mean(librosa.feature.spectral_centroid(y=y, sr=sr))
-        mfcc = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=N_MFCC)
-        mfcc_mean = np.mean(mfcc, axis=1)
-        
-        features = [zcr, rms, cent]
-        features.extend(mfcc_mean)
-        return np.array([features])
+        cent = np.mean(_spectral_centroid(mag))
+        mel = np.einsum("...ft,mf->...mt", mag ** 2, _MEL_BASIS, optimize=True)
+        mfcc = librosa.feature.mfcc(S=librosa.power_to_db(mel), n_mfcc=N_MFCC)
+
+        # 直接写进预分配的 (1, n_features) 数组（float64，与原来 np.array(list) 的结果一致），
+        # 不再先拼 Python 列表再整体转换
+        features = np.empty((1, len(FEATURE_NAMES)))
+        features[0, :3] = zcr, rms, cent
+        features[0, 3:] = np.mean(mfcc, axis=1)
+        return features
     except Exception as e:
         print(f"特征提取错误: {e}")
         return None
 
+def extract_features_batch(audio_files):
+    """批量提取特征：一次处理多个文件，特征定义与 extract_features 完全相同。
+
+    输入：音频文件路径（或文件对象）列表
+    输出：形状为 (len(audio_files), n_features) 的 float64 数组，行顺序与输入一致；
+          解码失败的文件对应整行为 NaN，调用方按 np.isnan 跳过即可。
+
+    所有波形先写进同一个 (B, T) 矩阵，STFT / ZCR / RMS / mel / MFCC 都沿 batch 维
+    一次算完（librosa 支持多维输入），省掉 B 次逐文件的 Python 调度。
+    唯一要逐条做的是 power_to_db：它的 top_db 截断以“整个数组的最大值”为基准，
+    整批一起算会让不同文件互相影响，和单条推理的结果对不上。
+    """
+    target = int(SAMPLE_RATE * DURATION)
+    features = np.full((len(audio_files), len(FEATURE_NAMES)), np.nan)
+    Y = np.zeros((len(audio_files), target), dtype=np.float32)
+    ok = np.zeros(len(audio_files), dtype=bool)
+    for i, audio_file in enumerate(audio_files):
+        try:
+            _load_fixed_length(audio_file, out=Y[i])
+            ok[i] = True
+        except Exception as e:
+            print(f"特征提取错误: {audio_file}: {e}")
+    if not ok.any():
+        return features
+
+    Y = Y[ok]
+    mag = np.abs(librosa.stft(Y))
+    zcr = _zero_crossing_rate(Y).mean(axis=-1)
+    rms = librosa.feature.rms(y=Y).mean(axis=(-2, -1))
+    cent = _spectral_centroid(mag).mean(axis=-1)
+    mel = np.einsum("...ft,mf->...mt", mag ** 2, _MEL_BASIS, optimize=True)
+    mel_db = np.stack([librosa.power_to_db(m) for m in mel])
+    mfcc_mean = librosa.feature.mfcc(S=mel_db, n_mfcc=N_MFCC).mean(axis=-1)
+
+    features[ok] = np.column_stack([zcr, rms, cent, mfcc_mean])
+    return features
+
+@_cache_data(max_entries=64, show_spinner=False)
+def extract_features_from_bytes(audio_bytes):
+    """按音频内容缓存的 extract_features。
+
+    Streamlit 每次点击/交互都会 rerun 整个脚本；同一份上传重复分析时，
+    以文件字节内容作为缓存 key，可以跳过解码 + STFT + MFCC 的全部计算。
+    """
+    return extract_features(io.BytesIO(audio_bytes))
+
+class _FlatForest:
+    """单输出 RandomForest（分类 / 回归）的扁平化预测器，predict 结果与原模型一致。
+
+    sklearn 的 forest.predict 对每棵树都要走一遍 Python 层（joblib 派发、输入校验、
+    predict_proba 归一化），单样本 100 棵树实测约 2.7ms，几乎全是调度开销。
+    这里把所有树的节点数组拼成一张大表，所有树按层一起往下走（叶子的左右孩子都指向
+    自己，走到叶子后原地不动），每层只是几次 NumPy 花式索引，单样本约 0.2ms。
+    判定规则照抄 sklearn：X 先转 float32，再与 float64 阈值比较 X <= threshold；
+    分类：每棵树的叶子分布先按行归一化，再按树的顺序累加、除以树的数量，最后取 argmax；
+    回归：叶子值按树的顺序累加再除以树的数量（即各树预测的平均），累加顺序不同，
+    与 sklearn 只在浮点舍入误差内一致（实测差 ~1e-15）；目前线上三个模型都是分类器。
+    含 NaN（sklearn 对缺失值另有分支规则）或特征数不符的输入，交回原模型处理。
+    """
+
+    def __init__(self, forest):
+        trees = [est.tree_ for est in forest.estimators_]
+        offsets = np.cumsum([0] + [t.node_count for t in trees[:-1]])
+        left, right, feature, value = [], [], [], []
+        is_classifier = hasattr(forest, "classes_")
+        for t, off in zip(trees, offsets):
+            node_ids = np.arange(t.node_count) + off
+            is_leaf = t.children_left == -1
+            left.append(np.where(is_leaf, node_ids, t.children_left + off))
+            right.append(np.where(is_leaf, node_ids, t.children_right + off))
+            feature.append(np.where(is_leaf, 0, t.feature))
+            v = t.value[:, 0, :]
+            if is_classifier:
+                # 与 DecisionTreeClassifier.predict_proba 相同：按行归一化，全 0 行分母记 1
+                normalizer = v.sum(axis=1, keepdims=True)
+                normalizer[normalizer == 0.0] = 1.0
+                v = v / normalizer
+            value.append(v)
+        self._forest = forest
+        self._is_classifier = is_classifier
+        self._roots = offsets.astype(np.intp)
+        self._left = np.concatenate(left).astype(np.intp)
+        self._right = np.concatenate(right).astype(np.intp)
+        self._feature = np.concatenate(feature).astype(np.intp)
+        self._threshold = np.concatenate([t.threshold for t in trees])
+        self._value = np.concatenate(value)
+        self._depth = max(t.max_depth for t in trees)
+
+    def predict(self, X):
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self._forest.n_features_in_ or np.isnan(X).any():
+            return self._forest.predict(X)
+        nodes = np.tile(self._roots, (X.shape[0], 1))
+        rows = np.arange(X.shape[0])[:, None]
+        for _ in range(self._depth):
+            go_left = X[rows, self._feature[nodes]] <= self._threshold[nodes]
+            nodes = np.where(go_left, self._left[nodes], self._right[nodes])
+        proba = self._value[nodes].sum(axis=1)
+        proba /= len(self._roots)
+        if not self._is_classifier:
+            return proba[:, 0]
+        return self._forest.classes_.take(np.argmax(proba, axis=1))
+
+
+@_cache_resource
+def _flat_forest(name):
+    """按模型名懒构建 _FlatForest（每个进程每个模型只转换一次，约 10ms）。
+
+    只转换真正用到的模型：weapon 模型 38 个类别，转换后叶子分布表约 28MB，
+    而本地推理只用 distance / direction。不是单输出 RF 的模型返回 None，调用方用原模型。
+    """
+    local_models = load_local_models()
+    model = (local_models or {}).get('models', {}).get(name)
+    try:
+        if model is None or model.n_outputs_ != 1:
+            return None
+        return _FlatForest(model)
+    except Exception:
+        return None
+
+
+def predict_local(feats, targets=("distance", "direction")):
+    """用本地 RF 模型对同一份特征一次性给出多个目标的预测。
+
+    输入：extract_features 的输出（形状 (1, n_features)）；targets 为要预测的模型名。
+    输出：{模型名: 预测标签}；模型不存在或特征为空时返回空 dict。
+
+    几个模型共用同一个特征数组，顺序逐个 predict 即可：每个 RF 训练时设了
+    n_jobs=-1，predict 内部已经按树并行；外面再套一层线程池只会增加调度开销
+    （单样本实测：顺序约 7ms，joblib threads 约 16ms）。
+    RF 模型走 _FlatForest（结果一致，单样本每个模型约 0.2ms），转换失败才用原模型。
+    """
+    local_models = load_local_models()
+    if not local_models or feats is None:
+        return {}
+    models = local_models['models']
+    return {
+        name: (_flat_forest(name) or models[name]).predict(feats)[0]
+        for name in targets if name in models
+    }
+
+@_cache_resource
+def _hf_client():
+    """复用同一个 gradio Client。
+
+    构造 Client 要和 Space 握手并下载 API schema，冷启动常常几百毫秒；
+    每次点击/请求都新建一个，这部分开销会原样叠加到每次推理上。
+    """
+    return Client(HF_SPACE_ID)
+
+
+def _reset_hf_client():
+    # st.cache_resource 包装出来的是 .clear()，lru_cache 是 .cache_clear()
+    clear = getattr(_hf_client, "clear", None) or _hf_client.cache_clear
+    clear()
+
+
 def predict_cloud(audio_file_path):
     """调用 Hugging Face 云端 API。
 
     失败时返回 {"error": "..."}，上层可以直接透传给前端并提示。
+    失败后丢掉缓存的 Client（Space 重启后旧连接可能失效），下次调用重新握手。
     """
     try:
-        client = Client(HF_SPACE_ID)
+        client = _hf_client()
         result = client.predict(
             handle_file(audio_file_path),
             api_name="/predict_weapon"
         )
         return result
     except Exception as e:
+        _reset_hf_client()
         return {"error": str(e)}
\ No newline at end of file
@@ -7,6 +7,7 @@
 import pandas as pd
 import toml
 import os
+from pymongo import UpdateOne
 from pymongo.mongo_client import MongoClient
 from pymongo.server_api import ServerApi
 
@@ -57,29 +58,34 @@ def process_audio_features(db):
     db.audio_features.delete_many({})
     print("旧声音特征数据已清空。")
     
-    # 批量插入
-    db.audio_features.insert_many(data_dict)
+    # 批量插入：ordered=False 让服务端不必按顺序逐批确认，某一条出错也不会中断后面的
+    db.audio_features.insert_many(data_dict, ordered=False)
     print(f"成功导入 {len(data_dict)} 条声音特征数据！")
     
     # --- 自动生成武器图鉴 (根据 CSV 里的武器名) ---
     # 这是作业要求的“武器管理”基础数据
     unique_weapons = df['weapon'].unique()
-    existing_weapons = db.game_weapons.distinct("name")
-    
-    new_weapons = []
-    for w in unique_weapons:
-        if w not in existing_weapons:
-            # 构造一个初始的武器对象
-            new_weapons.append({
-                "name": w,
+
+    # upsert + $setOnInsert：已存在的武器原样保留（不会覆盖网页端改过的属性），
+    # 不存在的才插入初始值。一次 bulk_write 提交，不用先 distinct 再在 Python 里比对，
+    # 脚本重复运行也是幂等的。
+    ops = [
+        UpdateOne(
+            {"name": w},
+            {"$setOnInsert": {
                 "type": "Unknown", # 以后在网页端修改
                 "damage": 0,       # 以后在网页端修改
                 "ammo_type": "N/A"
-            })
-    
-    if new_weapons:
-        db.game_weapons.insert_many(new_weapons)
-        print(f"自动在这个 game_weapons 表中补充了 {len(new_weapons)} 种新武器：{unique_weapons}")
+            }},
+            upsert=True,
+        )
+        for w in unique_weapons
+    ]
+
+    if ops:
+        result = db.game_weapons.bulk_write(ops, ordered=False)
+        if result.upserted_count:
+            print(f"自动在这个 game_weapons 表中补充了 {result.upserted_count} 种新武器：{unique_weapons}")
 
 if __name__ == "__main__":
     # 主程序入口
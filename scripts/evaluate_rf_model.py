@@ -16,6 +16,7 @@
 from __future__ import annotations
 
 import argparse
+import hashlib
 from datetime import datetime
 from pathlib import Path
 from typing import Any, Dict, Iterable, List, Optional, Tuple
@@ -23,6 +24,7 @@ from typing import Any, Dict, Iterable, List, Optional, Tuple
 import joblib
 import numpy as np
 import pandas as pd
+import sklearn
 
 # 在无头环境（例如 CI 或容器）中使用非交互式后端，避免显示相关错误
 import matplotlib
@@ -66,6 +68,9 @@ def _select_features(df: pd.DataFrame) -> Tuple[pd.DataFrame, List[str]]:
 
     # 只保留数值列，防止字符串列被误当作特征
     x = df.drop(columns=actual_drop, errors="ignore").select_dtypes(include=[np.number])
+    # sklearn 的决策树内部统一按 float32 处理特征，提前转好可省掉 fit/predict 时的整表拷贝，
+    # 结果与 float64 输入完全一致
+    x = x.astype(np.float32, copy=False)
     return x, list(x.columns)
 
 
@@ -83,19 +88,23 @@ def _maybe_split_by_dataset(
     if "dataset" not in df.columns:
         return None
 
-    dataset_values = df["dataset"].astype(str)
-    test_mask = dataset_values.eq(test_dataset_name)
+    # read_csv 读出的字符串列是 object dtype，直接在 numpy 数组上比较即可，
+    # 不必先 astype(str) 复制出一整列新字符串；其它 dtype 才需要转换
+    dataset_values = df["dataset"].to_numpy()
+    if dataset_values.dtype != object:
+        dataset_values = dataset_values.astype(str)
+    test_mask = dataset_values == test_dataset_name
 
     # 训练集为非测试集的数据
     train_mask = ~test_mask
 
-    if test_mask.sum() == 0:
+    if not test_mask.any():
         return None
 
-    if train_mask.sum() == 0:
+    if not train_mask.any():
         return None
 
-    return train_mask.to_numpy(), test_mask.to_numpy()
+    return train_mask, test_mask
 
 
 def _load_models(model_path: Path) -> Optional[Dict[str, Any]]:
@@ -123,6 +132,20 @@ def _load_models(model_path: Path) -> Optional[Dict[str, Any]]:
     return None
 
 
+def _train_cache_path(data_path: Path, out_dir: Path, *, extra: Tuple[Any, ...]) -> Path:
+    """根据 CSV 内容与训练参数生成缓存模型的路径。
+
+    同一份数据、同样的 n_estimators / random_state / 划分方式训练出来的 RF 完全一样，
+    重复出报告时直接复用上次的结果，不必再拟合一遍。
+    extra 里要带上 sklearn 版本和选出的特征列：换了 sklearn（pickle 不保证跨版本可用）
+    或特征选择逻辑变了，都应该换一个缓存文件，而不是复用旧模型。
+    """
+
+    h = hashlib.blake2b(data_path.read_bytes(), digest_size=8)
+    h.update(repr(extra).encode())
+    return out_dir / f"rf_cache_{h.hexdigest()}.pkl"
+
+
 def _train_models(
     x_train: pd.DataFrame,
     y_train_by_task: Dict[str, pd.Series],
@@ -150,12 +173,9 @@ def _plot_confusion_matrix(
     title: str,
     out_path: Path,
 ) -> None:
-    cm = confusion_matrix(y_true, y_pred, labels=labels)
-
-    # 使用归一化混淆矩阵，方便在报告中直观展示每一类的误判分布
-    with np.errstate(divide="ignore", invalid="ignore"):
-        cm = cm.astype(float) / cm.sum(axis=1, keepdims=True)
-        cm = np.nan_to_num(cm)
+    # 使用归一化混淆矩阵，方便在报告中直观展示每一类的误判分布；
+    # normalize="true" 按行（真实类别）归一化，测试集中没有样本的类别整行记为 0
+    cm = confusion_matrix(y_true, y_pred, labels=labels, normalize="true")
 
     # 标签较多时增加图像尺寸以保持可读性
     base = max(6.0, min(24.0, 0.45 * len(labels)))
@@ -233,7 +253,7 @@ def main() -> int:
     parser.add_argument(
         "--retrain",
         action="store_true",
-        help="Ignore model file and retrain for evaluation",
+        help="Ignore model file and the fit cache in output-dir, and retrain for evaluation",
     )
 
     args = parser.parse_args()
@@ -287,22 +307,36 @@ def main() -> int:
         # If the model package includes feature_names, align columns defensively.
         pkg_features = loaded_pkg.get("feature_names")
         if isinstance(pkg_features, list) and pkg_features:
-            # Create missing columns as zeros and drop extra columns.
-            for col in pkg_features:
-                if col not in x_train.columns:
-                    x_train[col] = 0.0
-                if col not in x_test.columns:
-                    x_test[col] = 0.0
-            x_train = x_train[pkg_features]
-            x_test = x_test[pkg_features]
+            # Create missing columns as zeros and drop extra columns, in one reindex each
+            # (no per-column inserts; astype keeps a single float32 block for sklearn).
+            x_train = x_train.reindex(columns=pkg_features, fill_value=0.0).astype(np.float32, copy=False)
+            x_test = x_test.reindex(columns=pkg_features, fill_value=0.0).astype(np.float32, copy=False)
             feature_names = pkg_features
     else:
-        models = _train_models(
-            x_train,
-            y_train_by_task,
-            n_estimators=args.n_estimators,
-            random_state=args.random_state,
+        cache_path = _train_cache_path(
+            data_path,
+            out_dir,
+            extra=(
+                args.n_estimators,
+                args.random_state,
+                args.test_dataset_name,
+                sklearn.__version__,
+                tuple(feature_names),
+            ),
         )
+        # --retrain 表示强制重新拟合：不读缓存，拟合完再覆盖写回
+        # 没有 --retrain 只是模型文件不存在时，才复用同数据/同参数的上一次拟合
+        cached_pkg = None if args.retrain else _load_models(cache_path)
+        if cached_pkg is not None:
+            models = dict(cached_pkg["models"])
+        else:
+            models = _train_models(
+                x_train,
+                y_train_by_task,
+                n_estimators=args.n_estimators,
+                random_state=args.random_state,
+            )
+            joblib.dump({"models": models, "feature_names": feature_names}, cache_path, compress=3)
 
     # Evaluate
     results: List[Dict[str, Any]] = []
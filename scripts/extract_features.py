@@ -4,21 +4,26 @@
 """
 
 import os
-import pandas as pd
+import sys
 import numpy as np
-import librosa
+import pandas as pd
 import warnings
+from joblib import Parallel, delayed
 from tqdm import tqdm # 进度条库
 
+# 以 python scripts/extract_features.py 运行时，需要把项目根目录加入 sys.path 才能 import logic
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from logic.ai_core import FEATURE_NAMES, extract_features_batch  # noqa: E402
+
 # 忽略 librosa 的一些警告
 warnings.filterwarnings('ignore')
 
 # --- 配置参数 ---
 DATA_DIR = "data/audio/sounds" # 解压后的音频根目录
 OUTPUT_FILE = "data/processed/weapon_features_final.csv"
-SAMPLE_RATE = 22050 # 标准采样率
-DURATION = 2.0      # 统一截取前 2 秒 (枪声通常很短)
-N_MFCC = 13         # 提取 13 个 MFCC 特征 (标准做法)
+BATCH_SIZE = 32     # 每批一起做 STFT/MFCC；特征计算与线上推理共用 logic.ai_core
+N_JOBS = -1         # 各批之间互不依赖，用 joblib 多进程并行（-1 = 用满所有 CPU 核）
+# 采样率 / 截取时长 / MFCC 数量统一在 logic/ai_core.py 里配置，训练与推理共用
 
 def parse_filename(filename):
     """
@@ -44,52 +49,9 @@ def parse_filename(filename):
             return None
     return info
 
-def extract_features(file_path):
-    """
-    核心函数: 读取音频 -> 提取 MFCC 特征
-    """
-    try:
-        # 1. 加载音频 (只取前 DURATION 秒)
-        y, sr = librosa.load(file_path, sr=SAMPLE_RATE, duration=DURATION)
-        
-        # 2. 如果音频太短，进行填充
-        if len(y) < SAMPLE_RATE * DURATION:
-            padding = int(SAMPLE_RATE * DURATION) - len(y)
-            y = np.pad(y, (0, padding), 'constant')
-
-        # 3. 提取特征
-        # A. Zero Crossing Rate (过零率 - 声音有多“尖”)
-        zcr = np.mean(librosa.feature.zero_crossing_rate(y))
-        
-        # B. RMS Energy (能量 - 声音有多响)
-        rms = np.mean(librosa.feature.rms(y=y))
-        
-        # C. Spectral Centroid (频谱质心 - 音色的明亮度)
-        cent = np.mean(librosa.feature.spectral_centroid(y=y, sr=sr))
-        
-        # D. MFCC (梅尔频率倒谱系数 - 核心特征，相当于声纹)
-        mfcc = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=N_MFCC)
-        # mfcc 返回的是 (n_mfcc, time_steps)，我们需要取平均值变成一维向量
-        mfcc_mean = np.mean(mfcc, axis=1)
-        
-        # 4. 组装特征字典
-        features = {
-            "zcr": zcr,
-            "rms": rms,
-            "spectral_centroid": cent
-        }
-        # 把 13 个 MFCC 数值展开: mfcc_0, mfcc_1 ...
-        for i in range(N_MFCC):
-            features[f'mfcc_{i}'] = mfcc_mean[i]
-            
-        return features
-        
-    except Exception as e:
-        print(f"Error processing {file_path}: {e}")
-        return None
-
 def process_dataset():
-    all_data = []
+    n_rows = 0
+    preview = None
     
     # 确保输出目录存在
     os.makedirs("data/processed", exist_ok=True)
@@ -105,38 +67,58 @@ def process_dataset():
             print(f"警告: 找不到目录 {dir_path}，请检查解压路径！")
             continue
             
-        for f in os.listdir(dir_path):
-            if f.endswith('.mp3'):
-                # 记录: (完整路径, 来源集合, 文件名)
-                file_list.append((os.path.join(dir_path, f), sub, f))
+        # os.scandir 的 DirEntry 自带 path/name 和文件类型，不用再 join 路径、也不用额外 stat
+        with os.scandir(dir_path) as it:
+            # 记录: (完整路径, 来源集合, 文件名)
+            file_list.extend(
+                (entry.path, sub, entry.name)
+                for entry in it
+                if entry.name.endswith('.mp3') and entry.is_file(follow_symlinks=False)
+            )
     
     print(f"共发现 {len(file_list)} 个音频文件，开始提取特征...")
     
-    # 使用 tqdm 显示进度条
-    for file_path, dataset_type, filename in tqdm(file_list):
-        # 1. 解析文件名标签
+    # 1. 先解析文件名标签，过滤掉命名不规范的文件
+    labeled = []
+    for file_path, dataset_type, filename in file_list:
         meta_info = parse_filename(filename)
-        if not meta_info:
-            continue
-            
-        # 2. 提取音频特征
-        features = extract_features(file_path)
-        if features:
-            # 3. 合并所有信息
-            # 标签 + 特征 + 数据集来源(train/test)
-            row = {**meta_info, **features, "dataset": dataset_type}
-            all_data.append(row)
-            
-    # 保存为 CSV
-    if all_data:
-        df = pd.DataFrame(all_data)
-        df.to_csv(OUTPUT_FILE, index=False)
-        print(f"\n特征提取完成！已保存至 {OUTPUT_FILE}")
-        print(f"数据预览:\n{df.head()}")
+        if meta_info:
+            labeled.append((file_path, dataset_type, meta_info))
+
+    # 2. 按批提取音频特征（使用 tqdm 显示进度条）
+    # 每批交给一个 loky 子进程；return_as="generator" 按提交顺序逐批返回，
+    # 进度条照常推进，CSV 的行顺序也和串行时一样。
+    batches = [labeled[start:start + BATCH_SIZE] for start in range(0, len(labeled), BATCH_SIZE)]
+    results = Parallel(n_jobs=N_JOBS, return_as="generator")(
+        delayed(extract_features_batch)([file_path for file_path, _, _ in batch]) for batch in batches
+    )
+    # 3. 每批算完就追加写入 CSV，不在内存里攒全量的行字典；
+    #    先写临时文件，全部成功后再替换，中途中断不会留下半份数据集
+    tmp_file = OUTPUT_FILE + ".tmp"
+    with tqdm(total=len(labeled)) as pbar, open(tmp_file, "w", newline="") as out:
+        for batch, matrix in zip(batches, results):
+            rows = []
+            for (file_path, dataset_type, meta_info), vector in zip(batch, matrix):
+                if np.isnan(vector).any():
+                    continue
+                # 合并所有信息：标签 + 特征 + 数据集来源(train/test)
+                rows.append({**meta_info, **dict(zip(FEATURE_NAMES, vector)), "dataset": dataset_type})
+            if rows:
+                chunk = pd.DataFrame(rows)
+                chunk.to_csv(out, index=False, header=(n_rows == 0))
+                if preview is None:
+                    preview = chunk.head()
+                n_rows += len(rows)
+            pbar.update(len(batch))
+
+    if n_rows:
+        os.replace(tmp_file, OUTPUT_FILE)
+        print(f"\n特征提取完成！共 {n_rows} 条，已保存至 {OUTPUT_FILE}")
+        print(f"数据预览:\n{preview}")
     else:
+        os.remove(tmp_file)
         print("没有提取到任何数据，请检查路径。")
 
 if __name__ == "__main__":
-    # 安装必要的库 (以防万一)
-    os.system("pip install librosa tqdm scikit-learn")
-    process_dataset()
\ No newline at end of file
+    # 依赖统一由 requirements.txt 安装，这里不再每次启动都调用 pip
+    process_dataset()
@@ -14,11 +14,16 @@ Mongo connection:
 """
 
 import os
+import sys
 import toml
 from datetime import datetime
 from pymongo.mongo_client import MongoClient
 from pymongo.server_api import ServerApi
 
+# 以 python scripts/init_db.py 运行时 sys.path[0] 是 scripts/，把项目根目录加进去才能 import utils
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from utils.security import make_hash  # noqa: E402  与 UI/后端共用同一套哈希格式
+
 
 def get_db_connection():
 	try:
@@ -37,34 +42,30 @@ def get_db_connection():
 		return None
 
 
-def make_hash(password: str) -> str:
-	import hashlib
-
-	return hashlib.sha256(str.encode(password)).hexdigest()
-
-
 def ensure_admin(db):
 	admin_id = os.getenv("ADMIN_STUDENT_ID", "admin")
 	admin_password = os.getenv("ADMIN_PASSWORD", "admin123")
 
-	existing = db.users.find_one({"student_id": admin_id})
-	if existing is None:
-		db.users.insert_one(
-			{
-				"student_id": admin_id,
+	# 一次 upsert 搞定三种情况，不用先 find_one 再写：
+	# 不存在 -> $setOnInsert 建号；已存在 -> 只 $set role，密码等字段原样保留
+	result = db.users.update_one(
+		{"student_id": admin_id},
+		{
+			"$set": {"role": "admin"},
+			"$setOnInsert": {
 				"password": make_hash(admin_password),
-				"role": "admin",
 				"inventory": [],
 				"created_at": datetime.now(),
-			}
-		)
+			},
+		},
+		upsert=True,
+	)
+	if result.upserted_id is not None:
 		print(f"已创建管理员账号: {admin_id}")
+	elif result.modified_count:
+		print(f"已将用户 {admin_id} 升级为管理员")
 	else:
-		if existing.get("role") != "admin":
-			db.users.update_one({"student_id": admin_id}, {"$set": {"role": "admin"}})
-			print(f"已将用户 {admin_id} 升级为管理员")
-		else:
-			print(f"管理员账号已存在: {admin_id}")
+		print(f"管理员账号已存在: {admin_id}")
 
 
 if __name__ == "__main__":
@@ -22,6 +22,8 @@ def train():
     # 过滤掉不存在的列
     actual_drop = [c for c in drop_cols if c in df.columns]
     X = df.drop(columns=actual_drop).select_dtypes(include=[np.number])
+    # RF 内部按 float32 建树，提前转换省掉 fit 时的整表拷贝，模型结果不变
+    X = X.astype(np.float32, copy=False)
     
     print(f"   特征维度: {X.shape}")
 
@@ -33,12 +35,16 @@ def train():
     }
     
     trained_models = {}
+
+    # 划分数据集：只切一次下标，三个任务共用同一组训练/测试行
+    # （与之前每个任务各调一次 train_test_split、random_state=42 得到的划分完全相同）
+    train_idx, test_idx = train_test_split(np.arange(len(X)), test_size=0.2, random_state=42)
+    X_train, X_test = X.iloc[train_idx], X.iloc[test_idx]
     
     for task_name, y in targets.items():
         print(f"\n--- 正在训练任务: [预测 {task_name}] ---")
         
-        # 划分数据集
-        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+        y_train, y_test = y.iloc[train_idx], y.iloc[test_idx]
         
         # 训练模型
         clf = RandomForestClassifier(n_estimators=100, n_jobs=-1, random_state=42)
@@ -57,7 +63,8 @@ def train():
         "models": trained_models, # 这里面包含了3个模型
         "feature_names": list(X.columns)
     }
-    joblib.dump(final_package, MODEL_FILE)
+    # compress=3：zlib 无损压缩，体积约为未压缩的 1/10（见 scripts/compress_model.py）
+    joblib.dump(final_package, MODEL_FILE, compress=3)
     print("全部完成！")
 
 if __name__ == "__main__":
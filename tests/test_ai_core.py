@@ -1,12 +1,32 @@
-import sys
-import os
 import pytest
 import numpy as np
 from unittest.mock import patch, MagicMock
 
-sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
+
+import librosa
+import soundfile as sf
+
+from logic.ai_core import (
+    SAMPLE_RATE,
+    _FlatForest,
+    _MEL_BASIS,
+    _hf_client,
+    _spectral_centroid,
+    _zero_crossing_rate,
+    extract_features,
+    extract_features_batch,
+    predict_cloud,
+)
+
+
+@pytest.fixture(autouse=True)
+def reset_hf_client():
+    # gradio Client 有进程级缓存，不清掉的话上一个用例 patch 出来的 Client 会串到下一个
+    _hf_client.cache_clear()
+    yield
+    _hf_client.cache_clear()
 
-from logic.ai_core import extract_features, predict_cloud
 
 class TestAICore:
     
@@ -18,10 +38,9 @@ class TestAICore:
         fake_sr = 22050
         mock_librosa.load.return_value = (fake_y, fake_sr)
         
-        # 模拟特征返回
-        mock_librosa.feature.zero_crossing_rate.return_value = np.array([[0.1]])
+        # 模拟特征返回（ZCR / 质心在 ai_core 里用 NumPy 直接算，只需给一个假的 STFT 幅度谱）
+        mock_librosa.stft.return_value = np.random.rand(1025, 87)
         mock_librosa.feature.rms.return_value = np.array([[0.2]])
-        mock_librosa.feature.spectral_centroid.return_value = np.array([[1000]])
         mock_librosa.feature.mfcc.return_value = np.random.rand(13, 100)
 
         result = extract_features("dummy_audio.mp3")
@@ -73,4 +92,100 @@ class TestAICore:
 
         # 验证
         assert "error" in result
-        assert "Connection Timeout" in result["error"]
\ No newline at end of file
+        assert "Connection Timeout" in result["error"]
+
+
+@pytest.fixture(scope="module")
+def forest_data():
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(300, 16))
+    y_cls = rng.integers(0, 5, size=300).astype(str)
+    y_reg = X[:, 0] * 3 + rng.normal(size=300)
+    X_new = rng.normal(size=(50, 16))
+    return X, y_cls, y_reg, X_new
+
+
+class TestFlatForest:
+    """_FlatForest 替代 sklearn 的 predict 跑本地推理，结果必须和原模型一致"""
+
+    def test_classifier_matches_sklearn(self, forest_data):
+        X, y_cls, _, X_new = forest_data
+        forest = RandomForestClassifier(n_estimators=20, random_state=0).fit(X, y_cls)
+        assert np.array_equal(_FlatForest(forest).predict(X_new), forest.predict(X_new))
+        # 单样本（predict_local 的实际用法）
+        assert np.array_equal(_FlatForest(forest).predict(X_new[:1]), forest.predict(X_new[:1]))
+
+    def test_regressor_matches_sklearn(self, forest_data):
+        X, _, y_reg, X_new = forest_data
+        forest = RandomForestRegressor(n_estimators=20, random_state=0).fit(X, y_reg)
+        np.testing.assert_allclose(_FlatForest(forest).predict(X_new), forest.predict(X_new), rtol=1e-12)
+
+    def test_nan_input_falls_back_to_sklearn(self, forest_data):
+        X, y_cls, _, X_new = forest_data
+        forest = RandomForestClassifier(n_estimators=20, random_state=0).fit(X, y_cls)
+        X_nan = X_new.copy()
+        X_nan[0, 3] = np.nan
+        flat = _FlatForest(forest)
+        with patch.object(forest, "predict", wraps=forest.predict) as spy:
+            result = flat.predict(X_nan)
+        spy.assert_called_once()
+        assert np.array_equal(result, forest.predict(X_nan))
+
+    def test_wrong_shape_falls_back_to_sklearn(self, forest_data):
+        X, y_cls, _, X_new = forest_data
+        forest = RandomForestClassifier(n_estimators=20, random_state=0).fit(X, y_cls)
+        flat = _FlatForest(forest)
+        # 特征数不符 / 一维输入：交给 sklearn，由它照常报错
+        with pytest.raises(ValueError):
+            flat.predict(X_new[:, :10])
+        with pytest.raises(ValueError):
+            flat.predict(X_new[0])
+
+
+def _test_signals():
+    # 随机信号 / 全零 / 开头一段静音：ZCR 的符号判定和质心的全零帧分支都要覆盖到
+    rng = np.random.default_rng(0)
+    noise = rng.standard_normal(SAMPLE_RATE * 2).astype(np.float32)
+    leading_zero = np.r_[np.zeros(1000), rng.standard_normal(SAMPLE_RATE * 2 - 1000)].astype(np.float32)
+    return {
+        "noise": noise,
+        "zeros": np.zeros(SAMPLE_RATE * 2, dtype=np.float32),
+        "leading_zero": leading_zero,
+    }
+
+
+class TestFeatureKernels:
+    """ai_core 里用 NumPy 重写的 ZCR / 质心 / mel 必须和 librosa 结果一致"""
+
+    @pytest.mark.parametrize("name", list(_test_signals()))
+    def test_matches_librosa(self, name):
+        y = _test_signals()[name]
+        assert np.array_equal(_zero_crossing_rate(y), librosa.feature.zero_crossing_rate(y)[0])
+
+        mag = np.abs(librosa.stft(y))
+        assert np.array_equal(_spectral_centroid(mag), librosa.feature.spectral_centroid(S=mag, sr=SAMPLE_RATE)[0])
+
+        mel = np.einsum("...ft,mf->...mt", mag ** 2, _MEL_BASIS, optimize=True)
+        assert np.array_equal(mel, librosa.feature.melspectrogram(S=mag ** 2, sr=SAMPLE_RATE))
+
+
+class TestFeatureBatch:
+    def test_batch_matches_single_and_skips_bad_files(self, tmp_path):
+        """测试：批量特征逐行等于逐个 extract_features；解码失败的文件整行 NaN 且不影响其它行"""
+        paths = []
+        for name, y in _test_signals().items():
+            path = tmp_path / f"{name}.wav"
+            sf.write(path, y, SAMPLE_RATE)
+            paths.append(str(path))
+        bad = tmp_path / "broken.wav"
+        bad.write_bytes(b"not audio")
+        paths.insert(1, str(bad))
+
+        batch = extract_features_batch(paths)
+
+        assert batch.shape == (len(paths), 16)
+        assert np.isnan(batch[1]).all()
+        for i, path in enumerate(paths):
+            if i == 1:
+                continue
+            np.testing.assert_allclose(batch[i], extract_features(path)[0], rtol=1e-9, atol=1e-9)
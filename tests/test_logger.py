@@ -0,0 +1,101 @@
+import queue
+import threading
+
+import pytest
+
+import utils.logger as audit
+
+
+class FakeLogs:
+    """假的 logs 集合：记录每次 insert_many 收到的批次；gate 不为空时写入会卡住直到放行"""
+
+    def __init__(self, gate=None):
+        self.batches = []
+        self.gate = gate
+
+    def insert_many(self, entries, ordered=False):
+        if self.gate is not None:
+            self.gate.wait(5)
+        self.batches.append([e["action"] for e in entries])
+
+
+class FakeDB:
+    def __init__(self, logs):
+        self.client = object()
+        self.name = "pubg_sys"
+        self.logs = logs
+
+
+@pytest.fixture
+def fresh_queue(monkeypatch):
+    # 每个用例一个新队列 / 新写线程 / 清零的丢弃计数，互不串扰
+    monkeypatch.setattr(audit, "_log_queue", queue.Queue(maxsize=audit.LOG_QUEUE_MAXSIZE))
+    monkeypatch.setattr(audit, "_writer_thread", None)
+    monkeypatch.setattr(audit, "_logs_slot", None)
+    monkeypatch.setattr(audit, "_dropped", 0)
+    monkeypatch.setattr(audit.logger, "disabled", True)
+
+
+@pytest.fixture
+def no_writer(monkeypatch, fresh_queue):
+    # 不起后台线程：flush_logs 走同步写入分支，批次划分是确定的
+    monkeypatch.setattr(audit, "_ensure_writer", lambda: None)
+
+
+class TestAuditLog:
+    def test_entries_are_batched(self, monkeypatch, no_writer):
+        """测试：记录按 LOG_BATCH_SIZE 攒批写入，顺序不变"""
+        monkeypatch.setattr(audit, "LOG_BATCH_SIZE", 5)
+        logs = FakeLogs()
+        db = FakeDB(logs)
+        for i in range(12):
+            audit.log_action(db, "u1", f"A{i}")
+        assert logs.batches == []  # log_action 本身不写库
+
+        audit.flush_logs()
+
+        assert [len(b) for b in logs.batches] == [5, 5, 2]
+        assert sum(logs.batches, []) == [f"A{i}" for i in range(12)]
+
+    def test_flush_waits_for_writer_thread(self, fresh_queue):
+        """测试：flush_logs 返回时后台线程已把队列写完"""
+        logs = FakeLogs()
+        db = FakeDB(logs)
+        for i in range(3):
+            audit.log_action(db, "u1", f"A{i}")
+
+        audit.flush_logs(timeout=2)
+
+        assert sum(logs.batches, []) == ["A0", "A1", "A2"]
+        assert audit._log_queue.unfinished_tasks == 0
+        assert audit.dropped_log_count() == 0
+
+    def test_flush_timeout_counts_leftovers_as_dropped(self, monkeypatch, fresh_queue):
+        """测试：写库卡住时 flush_logs 按时返回，队列里没取走的记录计入丢弃数（正在写的那批不算）"""
+        monkeypatch.setattr(audit, "LOG_BATCH_SIZE", 5)
+        gate = threading.Event()
+        logs = FakeLogs(gate)
+        db = FakeDB(logs)
+        for i in range(12):
+            audit.log_action(db, "u1", f"A{i}")
+
+        audit.flush_logs(timeout=0.3)
+
+        assert audit.dropped_log_count() == 7
+        # 再 flush 一次不会重复计数
+        gate.set()
+        audit.flush_logs(timeout=2)
+        assert audit.dropped_log_count() == 7
+        assert logs.batches == [[f"A{i}" for i in range(5)]]
+
+    def test_full_queue_drops_new_entries(self, monkeypatch, no_writer):
+        """测试：队列满了 log_action 不阻塞，新记录丢弃并计数"""
+        monkeypatch.setattr(audit, "_log_queue", queue.Queue(maxsize=3))
+        logs = FakeLogs()
+        db = FakeDB(logs)
+        for i in range(5):
+            audit.log_action(db, "u1", f"A{i}")
+
+        assert audit.dropped_log_count() == 2
+        audit.flush_logs()
+        assert sum(logs.batches, []) == ["A0", "A1", "A2"]
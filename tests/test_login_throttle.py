@@ -0,0 +1,57 @@
+import pytest
+from unittest.mock import patch, MagicMock
+from fastapi.testclient import TestClient
+
+import backend.main as backend
+from utils.database import make_hash
+
+
+@pytest.fixture
+def login_client():
+    # 假数据库：aggregate 每次都返回一份新的迭代器（login 里用 next() 取第一条）
+    user = {"student_id": "u1", "password": make_hash("right"), "role": "admin", "inventory_count": 0}
+    db = MagicMock()
+    db.users.aggregate.side_effect = lambda pipeline: iter([user])
+    backend._login_failures.clear()
+    with patch.object(backend, "get_db", return_value=db), patch.object(backend, "log_action"):
+        # 直连方是本机代理（Next.js），真实客户端 IP 走 X-Forwarded-For
+        yield TestClient(backend.app, client=("127.0.0.1", 50000))
+    backend._login_failures.clear()
+
+
+def _login(client, password, ip):
+    return client.post("/api/login", json={"student_id": "u1", "password": password},
+                       headers={"X-Forwarded-For": ip})
+
+
+class TestLoginThrottle:
+    def test_lockout_after_max_failures(self, login_client):
+        """测试：同一 IP 连续失败超过上限后进入退避期，密码对了也要等退避结束"""
+        codes = [_login(login_client, "wrong", "10.0.0.1").status_code
+                 for _ in range(backend.LOGIN_MAX_FAILURES)]
+        assert codes == [401] * backend.LOGIN_MAX_FAILURES
+
+        locked = _login(login_client, "right", "10.0.0.1")
+        assert locked.status_code == 429
+        assert int(locked.headers["Retry-After"]) >= 1
+
+    def test_correct_password_gets_in_while_locked(self, login_client):
+        """测试：别人把账号试到退避期时，正主从自己的 IP 仍能登录；退避期一过同一 IP 也能登录"""
+        for _ in range(backend.LOGIN_MAX_FAILURES):
+            _login(login_client, "wrong", "10.0.0.1")
+
+        assert _login(login_client, "right", "10.0.0.2").status_code == 200
+
+        # 把最近一次失败往前拨到退避期之外，模拟等待结束
+        key = ("u1", "10.0.0.1")
+        backend._login_failures[key][1] -= backend.LOGIN_MAX_BACKOFF + 1
+        assert _login(login_client, "right", "10.0.0.1").status_code == 200
+        assert key not in backend._login_failures  # 登录成功即清零
+
+    def test_backoff_grows_and_is_capped(self):
+        """测试：退避时间按 2 的幂增长，封顶 LOGIN_MAX_BACKOFF"""
+        n = backend.LOGIN_MAX_FAILURES
+        assert backend._login_backoff(n - 1) == 0
+        assert backend._login_backoff(n) == 1
+        assert backend._login_backoff(n + 2) == 4
+        assert backend._login_backoff(n + 50) == backend.LOGIN_MAX_BACKOFF
@@ -1,11 +1,8 @@
 import sys
-import os
 import pytest
 import joblib
 from unittest.mock import patch, MagicMock
 
-sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-
 # Mock streamlit before importing logic.ai_core to avoid config file errors
 # and to bypass @st.cache_resource
 mock_st = MagicMock()
@@ -14,6 +11,13 @@ sys.modules['streamlit'] = mock_st
 
 from logic.ai_core import load_local_models
 
+@pytest.fixture(autouse=True)
+def reset_model_cache():
+    # 非 Streamlit 环境下 load_local_models 带进程级缓存（lru_cache），每个用例前后清掉
+    load_local_models.cache_clear()
+    yield
+    load_local_models.cache_clear()
+
 class TestModelLoading:
     
     def test_load_local_models_success(self, tmp_path):
@@ -36,7 +40,9 @@ class TestModelLoading:
         # 我们需要 Patch 那个硬编码的路径，或者 Patch joblib.load 让它直接读我们的假数据。
         
         # 方案：直接 Patch joblib.load，这是最稳的
-        with patch('logic.ai_core.joblib.load') as mock_load:
+        # 预热（真跑一遍特征提取 + numba JIT）与加载逻辑无关，也一并 mock 掉，省下大半秒
+        with patch('logic.ai_core.joblib.load') as mock_load, \
+             patch('logic.ai_core._warmup_feature_pipeline'):
             with patch('logic.ai_core.os.path.exists') as mock_exists:
                 # 让代码以为文件存在
                 mock_exists.return_value = True
@@ -63,4 +69,19 @@ class TestModelLoading:
             
             # 断言应该返回 None (根据你的代码逻辑)
             assert result is None
-            print("\n模型缺失容错逻辑验证通过")
\ No newline at end of file
+            print("\n模型缺失容错逻辑验证通过")
+
+    def test_load_local_models_is_cached(self):
+        """
+        测试：模型包只在第一次调用时加载，之后直接复用（后端不再每个请求都 joblib.load）
+        """
+        with patch('logic.ai_core.joblib.load') as mock_load, \
+             patch('logic.ai_core.os.path.exists', return_value=True), \
+             patch('logic.ai_core._warmup_feature_pipeline'):
+            mock_load.return_value = {"models": {}}
+
+            first = load_local_models()
+            second = load_local_models()
+
+            assert first is second
+            assert mock_load.call_count == 1
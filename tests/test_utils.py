@@ -1,12 +1,15 @@
-import sys
-import os
 import pytest
 
-# --- 关键：把项目根目录加入 Python 搜索路径，否则找不到 utils 模块 ---
-sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-
 from utils.database import make_hash, check_hashes
 
+
+@pytest.fixture(scope="module")
+def hashed_pair():
+    # scrypt 每次几十毫秒：同一个模块里只算一次，校验类用例共用这份哈希
+    password = "my_password_123"
+    return password, make_hash(password)
+
+
 class TestSecurity:
     def test_hash_generation(self):
         """测试：加密后的字符串应该不再是明文"""
@@ -15,20 +18,29 @@ class TestSecurity:
         
         assert hashed != password
         assert isinstance(hashed, str)
-        assert len(hashed) == 64  # SHA256 产生的长度固定是 64 字符
+        assert hashed.startswith("scrypt$")  # 加盐 scrypt，盐和参数都编码在串里
+        assert make_hash(password) != hashed  # 每次随机盐，同一密码结果也不同
 
-    def test_hash_verification_success(self):
+    def test_hash_verification_success(self, hashed_pair):
         """测试：正确的密码应该校验通过"""
-        password = "my_password_123"
-        hashed = make_hash(password)
+        password, hashed = hashed_pair
         
         # 验证逻辑
         assert check_hashes(password, hashed) is True
 
-    def test_hash_verification_failure(self):
+    def test_hash_verification_failure(self, hashed_pair):
         """测试：错误的密码应该校验失败"""
-        password = "correct_password"
-        hashed = make_hash(password)
+        password, hashed = hashed_pair
         
         # 用错误的密码去试
-        assert check_hashes("wrong_password", hashed) is False
\ No newline at end of file
+        assert check_hashes("wrong_password", hashed) is False
+        # 账号不存在（没有存储的哈希）也应返回 False 而不是报错
+        assert check_hashes(password, None) is False
+
+    def test_legacy_sha256_still_verifies(self):
+        """测试：升级前存下的 SHA256 密码仍然可以登录"""
+        import hashlib
+        legacy = hashlib.sha256(b"old_password").hexdigest()
+
+        assert check_hashes("old_password", legacy) is True
+        assert check_hashes("wrong_password", legacy) is False
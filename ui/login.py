@@ -1,5 +1,6 @@
 import streamlit as st
 from datetime import datetime
+from pymongo.errors import DuplicateKeyError
 from utils.database import get_db, make_hash, check_hashes
 from utils.logger import log_action, get_logger  # <--- 新增导入
 import os
@@ -25,10 +26,13 @@ def render_login():
             password = st.text_input("密码", type='password')
             
             if st.button("登录", use_container_width=True):
-                user = db.users.find_one({"student_id": username})
-                if user and check_hashes(password, user['password']):
+                # 只取登录需要的字段：背包由主页面按需加载，不必在这里整份拉回来
+                user = db.users.find_one({"student_id": username}, {"_id": 0, "student_id": 1, "password": 1, "role": 1})
+                # 账号不存在也照常走一遍哈希（传 None），不通过耗时暴露学号是否存在
+                if check_hashes(password, user['password'] if user else None):
                     st.session_state['logged_in'] = True
-                    st.session_state['user_info'] = user
+                    # 密码哈希没必要留在 session_state 里
+                    st.session_state['user_info'] = {k: v for k, v in user.items() if k != 'password'}
                     st.session_state['username'] = username
                     
                     # --- 日志记录 ---
@@ -38,7 +42,7 @@ def render_login():
                     st.rerun()
                 else:
                     # --- 日志记录 (安全审计) ---
-                    logger.warning(f"登录失败: 用户 {username} 密码错误或账号不存在")
+                    logger.warning("登录失败: 用户 %s 密码错误或账号不存在", username)
                     st.error("账号或密码错误")
 
         with tab2:
@@ -52,18 +56,26 @@ def render_login():
                     return
                 if new_pass != confirm_pass:
                     st.error("两次密码输入不一致")
-                elif db.users.find_one({"student_id": new_user}):
+                    return
+                # 先 find_one：唯一索引可能没建成（_ensure_indexes 失败只告警），不能只靠它拦重复学号；
+                # 并发注册同时通过检查的竞态再由唯一索引（DuplicateKeyError）兜住
+                exists = db.users.find_one({"student_id": new_user}, {"_id": 1}) is not None
+                if not exists:
+                    try:
+                        db.users.insert_one({
+                            "student_id": new_user,
+                            "password": make_hash(new_pass),
+                            "role": "user",
+                            "inventory": [],
+                            "created_at": datetime.now()
+                        })
+                    except DuplicateKeyError:
+                        exists = True
+                if exists:
                     st.warning("该学号已存在！")
                     # --- 日志记录 ---
-                    logger.warning(f"注册失败: 学号 {new_user} 已存在")
+                    logger.warning("注册失败: 学号 %s 已存在", new_user)
                 else:
-                    db.users.insert_one({
-                        "student_id": new_user,
-                        "password": make_hash(new_pass),
-                        "role": "user",
-                        "inventory": [],
-                        "created_at": datetime.now()
-                    })
                     # --- 日志记录 ---
                     log_action(db, new_user, "REGISTER", "新用户注册成功")
                     
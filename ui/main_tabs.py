@@ -1,10 +1,12 @@
 import streamlit as st
 import pandas as pd
 import os
+import hashlib
 import tempfile
 from datetime import datetime
+from pymongo import UpdateOne
 from utils.database import get_db
-from logic.ai_core import load_local_models, extract_features, predict_cloud
+from logic.ai_core import load_local_models, extract_features_from_bytes, predict_cloud, predict_local
 from utils.logger import log_action
 
 # ==============================================================================
@@ -180,6 +182,100 @@ def render_stat_card(title, value, sub_label, trend, trend_val, color_class, ico
     """
     st.markdown(html, unsafe_allow_html=True)
 
+# ==============================================================================
+# 数据读取 (每次 rerun 只打一次数据库)
+# ==============================================================================
+# 页面实际用到的列；DataFrame 按固定列构造，缺字段的文档也不会让列对不齐
+WEAPON_COLUMNS = ["name", "type", "damage"]
+INVENTORY_COLUMNS = ["weapon_name", "ammo_count"]
+
+
+@st.cache_data(ttl=5, show_spinner=False)
+def _load_inventory(student_id):
+    """读取当前用户背包并构造成 DataFrame（短 TTL 缓存）。
+
+    Streamlit 每次交互都会从头 rerun 脚本，不缓存的话每次点击都要打一次数据库。
+    背包会被频繁写入，所以 TTL 很短；任何写操作之后都会 clear()。
+    和图鉴一样直接缓存构造好的 DataFrame，无关控件触发的 rerun 不再重复建表。
+    """
+    # 页面只用到 weapon_name / ammo_count，added_at 不必传回来
+    doc = get_db().users.find_one(
+        {"student_id": student_id},
+        {"_id": 0, "inventory.weapon_name": 1, "inventory.ammo_count": 1},
+    )
+    inventory = (doc or {}).get("inventory", [])
+    df = pd.DataFrame.from_records(inventory, columns=INVENTORY_COLUMNS)
+    df["ammo_count"] = df["ammo_count"].fillna(0).astype("int64")
+    return df
+
+
+@st.cache_data(ttl=60, show_spinner=False)
+def _load_weapons_df():
+    """读取武器图鉴并构造成 DataFrame（较长 TTL 缓存）。
+
+    图鉴只有管理员会改，没必要每次 rerun（比如搜索框每敲一个字）都重新拉全表。
+    单独缓存还有一个好处：用户增删背包只会让背包缓存失效，不会连带重拉图鉴。
+    管理员保存修改后会 clear()。
+    图鉴卡片和管理页只用到 name/type/damage，投影掉 stats 等子文档，少传少解码。
+    列固定后用 from_records 构造，并显式指定 dtype，省掉逐列类型推断。
+    """
+    cursor = get_db().game_weapons.find({}, {"_id": 0, "name": 1, "type": 1, "damage": 1})
+    df = pd.DataFrame.from_records(list(cursor), columns=WEAPON_COLUMNS)
+    df["damage"] = df["damage"].fillna(0).astype("int32")
+    df["type"] = df["type"].fillna("Unknown")
+    return df
+
+
+@st.cache_data(ttl=300, show_spinner=False)
+def _local_images():
+    """images/ 目录下已有的武器图片文件名集合（5 分钟缓存）。
+
+    图鉴每张卡片都要判断有没有本地配图；一次 listdir 换成集合查表，
+    不用每次 rerun 对每把武器各做一次 os.path.exists（stat 系统调用）。
+    """
+    try:
+        return frozenset(os.listdir("images"))
+    except OSError:
+        return frozenset()
+
+
+@st.fragment
+def _weapon_card(idx, name, weapon_type, img_src, student_id):
+    """图鉴里的单张武器卡片（st.fragment）。
+
+    每张卡片都有数量输入框和入库按钮；做成 fragment 后，调数量或点入库只重跑这一张卡片，
+    不会把整页（顶部指标、其它 tab、其余几十张卡片）从头再执行一遍。
+    顶部指标和资产概览在下一次整页 rerun 时刷新（背包缓存已在写入后清掉）。
+    """
+    # 这种卡片我们用原生 container 配合 border=True，因为里面要放交互组件
+    with st.container(border=True):
+        c_img, c_info = st.columns([1, 2])
+        with c_img:
+            st.image(img_src, width=60)
+        with c_info:
+            st.markdown(f"**{name}**")
+            st.caption(f"{weapon_type}")
+
+        val = st.number_input("Qty", 1, 999, 30, key=f"n_{idx}", label_visibility="collapsed")
+        if st.button("入库", key=f"b_{idx}", use_container_width=True):
+            db = get_db()
+            item = {"weapon_name": name, "ammo_count": val, "added_at": datetime.now()}
+            _flush(db.users, [UpdateOne({"student_id": student_id}, {"$push": {"inventory": item}})], _load_inventory)
+            log_action(db, student_id, "ADD_ITEM", item)
+            st.toast(f"已添加 {name}")
+
+
+def _flush(collection, ops, *caches):
+    """统一的写入出口：用 bulk_write(ordered=False) 一次提交一批更新。
+
+    单次点击时与 update_one 同样是一个 RTT；以后 UI 支持多选（批量丢弃等），
+    N 个操作也只需要一次往返。写完后让传入的读缓存失效。
+    """
+    result = collection.bulk_write(ops, ordered=False)
+    for cache in caches:
+        cache.clear()
+    return result
+
 # ==============================================================================
 # 主程序逻辑
 # ==============================================================================
@@ -215,9 +311,7 @@ def render_main_app():
         """, unsafe_allow_html=True)
 
     # --- 数据准备 ---
-    curr_user = db.users.find_one({"student_id": user['student_id']})
-    inventory = curr_user.get('inventory', [])
-    df_inv = pd.DataFrame(inventory)
+    df_inv = _load_inventory(user['student_id'])
     total_ammo = df_inv['ammo_count'].sum() if not df_inv.empty else 0
     
     # --- 1. 顶部指标卡片组 (HTML渲染) ---
@@ -226,7 +320,7 @@ def render_main_app():
     with col1:
         render_stat_card("军械库总储备", f"{total_ammo:,}", "战术评估值: High", "down", "3.5%", "amber", "AMMO")
     with col2:
-        render_stat_card("武器库存量", str(len(inventory)), "件现役装备", "up", "12%", "blue", "BOX")
+        render_stat_card("武器库存量", str(len(df_inv.index)), "件现役装备", "up", "12%", "blue", "BOX")
     with col3:
         render_stat_card("系统负载", "42%", "运行状态良好", "up", "Stable", "emerald", "SYS")
     with col4:
@@ -260,19 +354,19 @@ def render_main_app():
             st.markdown('<div class="glass-card">', unsafe_allow_html=True)
             st.markdown('<h3 style="color:white; margin-top:0;">重点物资</h3>', unsafe_allow_html=True)
             if not df_inv.empty:
-                # 简化显示
-                for idx, row in df_inv.head(5).iterrows():
+                # 简化显示（itertuples 直接给元组，不像 iterrows 每行都装箱成一个 Series）
+                for row in df_inv.head(5).itertuples(index=False):
                     st.markdown(f"""
                     <div style="display: flex; justify-content: space-between; padding: 10px 0; border-bottom: 1px solid rgba(255,255,255,0.05);">
                         <div style="display: flex; gap: 10px; align-items: center;">
                             <div style="background: rgba(16,185,129,0.2); color: #34d399; width: 30px; height: 30px; border-radius: 50%; display: flex; align-items: center; justify-content: center;">W</div>
                             <div>
-                                <div style="color: #e2e8f0; font-size: 14px; font-weight: bold;">{row['weapon_name']}</div>
+                                <div style="color: #e2e8f0; font-size: 14px; font-weight: bold;">{row.weapon_name}</div>
                                 <div style="color: #64748b; font-size: 12px;">突击步枪</div>
                             </div>
                         </div>
                         <div style="text-align: right;">
-                            <div style="color: white; font-family: monospace;">{row['ammo_count']}</div>
+                            <div style="color: white; font-family: monospace;">{row.ammo_count}</div>
                             <div style="color: #64748b; font-size: 10px;">库存</div>
                         </div>
                     </div>
@@ -280,9 +374,12 @@ def render_main_app():
                 
                 # 丢弃功能
                 st.markdown("<br>", unsafe_allow_html=True)
-                to_remove = st.selectbox("选择丢弃物资", df_inv['weapon_name'].unique(), key='inv_rem')
-                if st.button("确认丢弃"):
-                    db.users.update_one({"student_id": user['student_id']}, {"$pull": {"inventory": {"weapon_name": to_remove}}})
+                # 放进 form：切换下拉框不会触发整页 rerun，只有点确认才提交
+                with st.form("drop_form", border=False):
+                    to_remove = st.selectbox("选择丢弃物资", df_inv['weapon_name'].unique(), key='inv_rem')
+                    dropped = st.form_submit_button("确认丢弃")
+                if dropped:
+                    _flush(db.users, [UpdateOne({"student_id": user['student_id']}, {"$pull": {"inventory": {"weapon_name": to_remove}}})], _load_inventory)
                     log_action(db, user['student_id'], "INVENTORY_REMOVE", f"丢弃 {to_remove}")
                     st.rerun()
             else:
@@ -292,38 +389,29 @@ def render_main_app():
     # --- Tab 2: 武器图鉴 ---
     with t2:
         st.markdown('<div class="glass-card">', unsafe_allow_html=True)
-        weapons = list(db.game_weapons.find({}, {"_id": 0}))
         
         # Search Bar
         col_s1, col_s2 = st.columns([3, 1])
         with col_s1:
             search_txt = st.text_input("检索武器数据库...", placeholder="输入型号...")
         
-        df_w = pd.DataFrame(weapons)
+        df_all = _load_weapons_df()
+        df_w = df_all
         if search_txt and not df_w.empty:
-            df_w = df_w[df_w['name'].str.contains(search_txt, case=False)]
+            # regex=False：按字面子串匹配，输入 "(" 之类的字符也不会触发正则编译报错；
+            # na=False：缺 name 的文档直接不匹配，不会让布尔索引里混进 NaN
+            df_w = df_w[df_w['name'].str.contains(search_txt, case=False, regex=False, na=False)]
             
         # Grid Layout
         cols = st.columns(3)
-        for idx, row in df_w.iterrows():
+        local_images = _local_images()
+        # itertuples 比 iterrows 少一层逐行 Series 构造；Index 仍是原始行号，控件 key 不变
+        for row in df_w.itertuples():
+            idx = row.Index
+            img_name = f"{row.name}.png"
+            img_src = f"images/{img_name}" if img_name in local_images else "https://img.icons8.com/ios-filled/100/FFFFFF/gun.png"
             with cols[idx % 3]:
-                # 这种卡片我们用原生 container 配合 border=True，因为里面要放交互组件
-                with st.container(border=True):
-                    c_img, c_info = st.columns([1, 2])
-                    with c_img:
-                        local_img = f"images/{row['name']}.png"
-                        img_src = local_img if os.path.exists(local_img) else "https://img.icons8.com/ios-filled/100/FFFFFF/gun.png"
-                        st.image(img_src, width=60)
-                    with c_info:
-                        st.markdown(f"**{row['name']}**")
-                        st.caption(f"{row['type']}")
-                    
-                    val = st.number_input("Qty", 1, 999, 30, key=f"n_{idx}", label_visibility="collapsed")
-                    if st.button("入库", key=f"b_{idx}", use_container_width=True):
-                         item = {"weapon_name": row['name'], "ammo_count": val, "added_at": datetime.now()}
-                         db.users.update_one({"student_id": user['student_id']}, {"$push": {"inventory": item}})
-                         log_action(db, user['student_id'], "ADD_ITEM", item)
-                         st.toast(f"已添加 {row['name']}")
+                _weapon_card(idx, row.name, row.type, img_src, user['student_id'])
         
         st.markdown('</div>', unsafe_allow_html=True)
 
@@ -332,15 +420,16 @@ def render_main_app():
         st.markdown('<div class="glass-card">', unsafe_allow_html=True)
         st.warning("核心数据修改区域")
         if not df_w.empty:
-            target = st.selectbox("选择编辑对象", df_w['name'].unique())
-            curr = db.game_weapons.find_one({"name": target})
+            target = st.selectbox("选择编辑对象", df_w['name'].drop_duplicates().tolist())
+            # 直接复用缓存里的图鉴数据，不再单独 find_one（缺失字段已在加载时补默认值）
+            curr = df_all[df_all['name'] == target].iloc[0]
             
             c1, c2 = st.columns(2)
-            n_dmg = c1.number_input("Damage", value=int(curr.get('damage', 0)))
-            n_type = c2.text_input("Type", value=curr.get('type', 'Unknown'))
+            n_dmg = c1.number_input("Damage", value=int(curr['damage']))
+            n_type = c2.text_input("Type", value=curr['type'])
             
             if st.button("更新数据库记录"):
-                db.game_weapons.update_one({"name": target}, {"$set": {"damage": n_dmg, "type": n_type}})
+                _flush(db.game_weapons, [UpdateOne({"name": target}, {"$set": {"damage": n_dmg, "type": n_type}})], _load_weapons_df)
                 log_action(db, user['student_id'], "ADMIN_UPDATE", {"target": target})
                 st.success("Done")
         st.markdown('</div>', unsafe_allow_html=True)
@@ -360,42 +449,64 @@ def render_main_app():
             st.markdown('<div class="glass-card">', unsafe_allow_html=True)
             st.markdown("### 分析结果")
             
-            if uploaded and start:
-                with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as tmp:
-                    tmp.write(uploaded.getbuffer())
+            # 以上传内容的摘要作为身份标识：同一文件重复点击、或页面上其它控件触发 rerun 时，
+            # 直接复用 session_state 里的结果，不再重复调用云端 / 解码 / 预测。
+            audio_bytes = uploaded.getvalue() if uploaded else None
+            digest = hashlib.md5(audio_bytes).hexdigest() if audio_bytes else None
+
+            if start and digest and st.session_state.get('audio_digest') != digest:
+                # gradio 的 handle_file 只认本地路径/URL，云端这一路只能落盘；
+                # 用唯一临时文件（多会话并发不会互相覆盖），后缀跟随上传文件，finally 里删掉。
+                suffix = os.path.splitext(uploaded.name)[1] or ".mp3"
+                with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
+                    tmp.write(audio_bytes)
                     path = tmp.name
                 
                 try:
                     # Mocking for UI visualization
                     with st.spinner("正在进行云端特征比对..."):
                         cloud_res = predict_cloud(path)
-                        # ... (保留你的逻辑) ...
-                        
-                        # 这里为了展示 UI 效果，假设已有结果
-                        c_name = cloud_res.get('label', 'M416') if isinstance(cloud_res, dict) else 'M416'
-                        conf = 0.92
-                        l_dist = 124
-                        
-                    # 结果展示区
-                    r1, r2, r3 = st.columns(3)
-                    with r1:
-                        st.markdown(f"""
-                        <div style="text-align:center;">
-                            <div style="color:#64748b; font-size:12px;">识别型号</div>
-                            <div style="color:#34d399; font-size:24px; font-weight:bold;">{c_name}</div>
-                        </div>
-                        """, unsafe_allow_html=True)
-                    with r2:
-                         st.metric("置信度", f"{conf:.1%}")
-                    with r3:
-                         st.metric("距离估算", f"{l_dist}m")
-                         
+
+                    # predict_cloud 失败时不抛异常而是返回 {"error": ...}：这种结果不能按 digest 存下来，
+                    # 否则同一个文件再点“启动分析”会命中缓存，永远不会重试
+                    if isinstance(cloud_res, dict) and "error" in cloud_res:
+                        raise RuntimeError(f"云端识别失败，请重试：{cloud_res['error']}")
+
+                    # 这里为了展示 UI 效果，假设已有结果
+                    c_name = cloud_res.get('label', 'M416') if isinstance(cloud_res, dict) else 'M416'
+                    conf = 0.92
+
+                    # 本地距离估算：特征按上传内容缓存，重复点击同一文件不会重新解码/算 MFCC。
+                    l_dist = "N/A"
+                    with st.spinner("正在进行本地距离估算..."):
+                        if load_local_models():
+                            preds = predict_local(extract_features_from_bytes(audio_bytes), ("distance",))
+                            l_dist = preds.get('distance', "N/A")
+
+                    st.session_state['audio_digest'] = digest
+                    st.session_state['ai_result'] = {"name": c_name, "conf": conf, "dist": l_dist}
                     log_action(db, user['student_id'], "AI_USE", {"res": c_name})
                     
                 except Exception as e:
                     st.error(str(e))
                 finally:
                     if os.path.exists(path): os.remove(path)
+
+            result = st.session_state.get('ai_result') if digest and digest == st.session_state.get('audio_digest') else None
+            if result:
+                # 结果展示区
+                r1, r2, r3 = st.columns(3)
+                with r1:
+                    st.markdown(f"""
+                    <div style="text-align:center;">
+                        <div style="color:#64748b; font-size:12px;">识别型号</div>
+                        <div style="color:#34d399; font-size:24px; font-weight:bold;">{result['name']}</div>
+                    </div>
+                    """, unsafe_allow_html=True)
+                with r2:
+                     st.metric("置信度", f"{result['conf']:.1%}")
+                with r3:
+                     st.metric("距离估算", str(result['dist']))
             else:
                 st.info("等待信号输入...")
                 
@@ -11,10 +11,33 @@
 """
 
 import streamlit as st
-import hashlib
 import os  # <--- 必须引入 os
+import threading
 from pymongo.mongo_client import MongoClient
 from pymongo.server_api import ServerApi
+from utils.logger import get_logger
+# 密码工具已拆到不依赖 streamlit 的 utils.security；这里保留导出，老的 import 路径继续可用
+from utils.security import make_hash, check_hashes  # noqa: F401
+
+logger = get_logger()
+
+
+def _ensure_indexes(client):
+    """为高频查询字段建唯一索引（幂等，重复调用无副作用）。
+
+    - users.student_id：登录/背包/管理员校验都按学号 find_one
+    - game_weapons.name：管理员更新、图鉴查找都按武器名匹配
+    没有索引时这些查询都是全表扫描（COLLSCAN），数据量一大就线性变慢。
+    建索引失败（例如历史数据里有重复学号）只告警，不影响连接本身。
+    在后台线程里跑（见 init_connection）：create_index 会触发真正的建连，
+    MongoDB 连不上时要等满 serverSelectionTimeoutMS（默认 30s）才报错，不能卡在启动路径上。
+    """
+    db = client.pubg_sys
+    try:
+        db.users.create_index("student_id", unique=True)
+        db.game_weapons.create_index("name", unique=True)
+    except Exception as e:
+        logger.warning("创建索引失败: %s", e)
 
 @st.cache_resource
 def init_connection():
@@ -42,7 +65,10 @@ def init_connection():
             st.error("未找到数据库配置！请检查 .streamlit/secrets.toml 或 环境变量 MONGO_URI")
             return None
 
-        return MongoClient(uri, server_api=ServerApi('1'))
+        client = MongoClient(uri, server_api=ServerApi('1'))
+        # 放在 cache_resource 里：每个进程只会执行一次；后台线程建索引，不阻塞启动
+        threading.Thread(target=_ensure_indexes, args=(client,), name="mongo-ensure-indexes", daemon=True).start()
+        return client
 
     except Exception as e:
         st.error(f"数据库连接异常: {e}")
@@ -58,11 +84,3 @@ def get_db():
     if client is not None:  # <--- 必须显式判断 is not None
         return client.pubg_sys
     return None
-
-def make_hash(password):
-    """SHA256 加密"""
-    return hashlib.sha256(str.encode(password)).hexdigest()
-
-def check_hashes(password, hashed_text):
-    """密码校验"""
-    return make_hash(password) == hashed_text
\ No newline at end of file
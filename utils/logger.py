@@ -8,35 +8,188 @@
 所以不要在这里做 UI 相关依赖（比如 st.*），保持它纯粹。
 """
 
+import atexit
 import logging
+import os
+import queue
+import threading
+import time
 from datetime import datetime
 
 # --- 1. 系统级日志配置 (控制台输出) ---
 # 防止重复配置：在 Streamlit/FastAPI 的热重载环境下，模块可能被重复 import。
 logger = logging.getLogger("PUBG_System")
 if not logger.handlers:
-    logger.setLevel(logging.INFO)
+    # 生产环境可以设 PUBG_LOG_LEVEL=WARNING：log_action 的控制台镜像（INFO）直接被级别过滤掉，
+    # 不格式化也不写 stdout；审计记录照常进 MongoDB，WARN/ERROR 仍然会打印。
+    # 写错的值（比如 verbose）退回 INFO，不能让一个环境变量拼写错误把所有 import 本模块的进程拖垮。
+    _console_level = logging.getLevelName(os.environ.get("PUBG_LOG_LEVEL", "INFO").upper())
+    logger.setLevel(_console_level if isinstance(_console_level, int) else logging.INFO)
     formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
     
     # 输出到控制台
     console_handler = logging.StreamHandler()
     console_handler.setFormatter(formatter)
     logger.addHandler(console_handler)
+    # 自己已经挂了控制台 handler；不要再冒泡到 root，否则 root 一旦也配置了 handler 每行会打两遍
+    logger.propagate = False
 
 def get_logger():
     """获取系统日志记录器"""
     return logger
 
 # --- 2. 业务审计日志 (写入 MongoDB) ---
+# 审计日志不在请求里同步写库：log_action 只把记录放进队列，由后台线程攒批后
+# insert_many 一次写入（最多 LOG_BATCH_SIZE 条，或者等满 LOG_FLUSH_INTERVAL 秒）。
+# 这样每个接口/每次点击都少一次 Mongo 往返；进程退出时 atexit 会把剩下的写完（最多等 LOG_FLUSH_TIMEOUT 秒）。
+LOG_BATCH_SIZE = 100
+LOG_FLUSH_INTERVAL = 0.1  # 秒
+# flush_logs 最多等这么久：Mongo 慢/挂了的时候宁可丢掉剩下的日志（计入丢弃数），也不卡住进程退出
+LOG_FLUSH_TIMEOUT = 5.0  # 秒
+# 队列上限：Mongo 卡住时写线程会堵在 insert_many 上，不设上限的话积压会一直涨内存。
+# 满了就丢弃新记录并计数（审计日志不应该反过来阻塞业务），控制台每丢 LOG_DROP_WARN_EVERY 条提醒一次。
+LOG_QUEUE_MAXSIZE = 20000
+LOG_DROP_WARN_EVERY = 1000
+
+# 审计级别阈值：低于 PUBG_AUDIT_LEVEL 的记录在 log_action 开头直接返回，不入队也不写库。
+# 默认 INFO（全部记录）；设成 WARN 时只保留登录失败/注册失败这类告警记录。
+_AUDIT_LEVEL_RANK = {"DEBUG": 10, "INFO": 20, "WARN": 30, "WARNING": 30, "ERROR": 40}
+_MIN_AUDIT_RANK = _AUDIT_LEVEL_RANK.get(os.environ.get("PUBG_AUDIT_LEVEL", "INFO").upper(), 20)
+
+_log_queue = queue.Queue(maxsize=LOG_QUEUE_MAXSIZE)
+# log_action 每次都要取时间：先绑定成模块级名字，省掉 datetime.now 的属性查找
+_now = datetime.now
+# db.logs 每次都会新建一个 Collection 对象（约 5µs），而 get_db() 每次也返回新的 Database。
+# 这里按 (client, 库名) 缓存一份 logs 集合句柄；换了 client（重连）就重新取。
+_logs_slot = None
+_dropped = 0
+# log_action 会被多个线程（FastAPI 线程池、Streamlit 各会话）同时调用，+= 不是原子操作
+_dropped_lock = threading.Lock()
+_writer_lock = threading.Lock()
+_writer_thread = None
+
+
+def _logs_collection(db):
+    global _logs_slot
+    slot = _logs_slot
+    if slot is not None and slot[0] is db.client and slot[1] == db.name:
+        return slot[2]
+    coll = db.logs
+    _logs_slot = (db.client, db.name, coll)
+    return coll
+
+
+def _write_batch(batch):
+    # 正常只有一个 db；保险起见按 logs 集合分组（pymongo 的 Collection 按库名+集合名判等）
+    groups = []
+    for coll, entry in batch:
+        for g_coll, entries in groups:
+            if g_coll is coll or g_coll == coll:
+                entries.append(entry)
+                break
+        else:
+            groups.append((coll, [entry]))
+    for coll, entries in groups:
+        try:
+            coll.insert_many(entries, ordered=False)
+        except Exception as e:
+            logger.error("写入审计日志失败: %s", e)
+
+
+def _drain_once(block=True):
+    """取出一批（至多 LOG_BATCH_SIZE 条，或攒满 LOG_FLUSH_INTERVAL 秒）写库；队列为空返回 False。"""
+    try:
+        first = _log_queue.get() if block else _log_queue.get_nowait()
+    except queue.Empty:
+        return False
+    batch = [first]
+    deadline = time.monotonic() + LOG_FLUSH_INTERVAL
+    while len(batch) < LOG_BATCH_SIZE:
+        remaining = deadline - time.monotonic()
+        try:
+            batch.append(_log_queue.get(timeout=remaining) if block and remaining > 0 else _log_queue.get_nowait())
+        except queue.Empty:
+            break
+    try:
+        _write_batch(batch)
+    finally:
+        for _ in batch:
+            _log_queue.task_done()
+    return True
+
+
+def _writer_loop():
+    while True:
+        _drain_once()
+
+
+def _ensure_writer():
+    # 第一次写日志时才起线程：pytest / 脚本只 import 模块时不会多出一个后台线程
+    global _writer_thread
+    if _writer_thread is not None and _writer_thread.is_alive():
+        return
+    with _writer_lock:
+        if _writer_thread is None or not _writer_thread.is_alive():
+            _writer_thread = threading.Thread(target=_writer_loop, name="audit-log-writer", daemon=True)
+            _writer_thread.start()
+
+
+def _count_dropped(n):
+    """丢弃计数加 n，返回加完之后的总数。"""
+    global _dropped
+    with _dropped_lock:
+        _dropped += n
+        return _dropped
+
+
+def dropped_log_count():
+    """因队列已满或 flush_logs 超时而丢弃的审计日志条数（进程内累计）。"""
+    return _dropped
+
+
+def flush_logs(timeout=LOG_FLUSH_TIMEOUT):
+    """等已入队的审计日志写完（进程退出、测试断言前调用），最多等 timeout 秒。
+
+    超时后把队列里还没被取走的记录直接丢弃（计入 dropped_log_count() 并告警）再返回；
+    写线程手上正在写的那一批不算丢弃，它写完与否不再等待。
+    """
+    deadline = time.monotonic() + timeout
+    if _writer_thread is not None and _writer_thread.is_alive():
+        while _log_queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+    else:
+        while time.monotonic() < deadline and _drain_once(block=False):
+            pass
+    if not _log_queue.unfinished_tasks:
+        return
+    left = 0
+    while True:
+        try:
+            _log_queue.get_nowait()
+        except queue.Empty:
+            break
+        _log_queue.task_done()
+        left += 1
+    if left:
+        _count_dropped(left)
+        logger.warning("审计日志 %.1f 秒内未写完，放弃剩余 %d 条", timeout, left)
+
+
+atexit.register(flush_logs)
+
+
 def log_action(db, user_id, action_type, details=None, level="INFO"):
     """
-    记录用户操作到数据库
+    记录用户操作到数据库（异步批量写入，调用方不等待写库完成）
     :param db: 数据库连接对象
     :param user_id: 操作者ID (学号)
     :param action_type: 动作类型 (如 LOGIN, ADD_ITEM, AI_PREDICT)
     :param details: 详细信息 (字典或字符串)
     :param level: 日志级别 (INFO, WARN, ERROR)
     """
+    if _AUDIT_LEVEL_RANK.get(level, 20) < _MIN_AUDIT_RANK:
+        return
+
     # 这里不 raise：
     # - 日志写入失败不应该让主流程崩掉（比如用户正常下单/分析不该因为日志挂了就失败）
     # - 但会在控制台输出 error，便于排查
@@ -45,8 +198,9 @@ def log_action(db, user_id, action_type, details=None, level="INFO"):
         return
 
     # 建议：后续可以在 logs 上建索引（timestamp/user_id/action），便于检索。
+    # timestamp 在调用时取，而不是写库时取，批量写入不影响记录的时间先后。
     log_entry = {
-        "timestamp": datetime.now(),
+        "timestamp": _now(),
         "user_id": user_id,
         "action": action_type,
         "level": level,
@@ -54,8 +208,14 @@ def log_action(db, user_id, action_type, details=None, level="INFO"):
     }
 
     try:
-        db.logs.insert_one(log_entry)
+        try:
+            _log_queue.put_nowait((_logs_collection(db), log_entry))
+        except queue.Full:
+            dropped = _count_dropped(1)
+            if dropped % LOG_DROP_WARN_EVERY == 1:
+                logger.warning("审计日志队列已满，已丢弃 %d 条", dropped)
+        _ensure_writer()
         # 同时打印到控制台方便开发调试
-        logger.info(f"[{user_id}] {action_type}: {details}")
+        logger.info("[%s] %s: %s", user_id, action_type, details)
     except Exception as e:
-        logger.error(f"写入审计日志失败: {e}")
\ No newline at end of file
+        logger.error("写入审计日志失败: %s", e)
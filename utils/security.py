@@ -0,0 +1,60 @@
+"""密码哈希工具（不依赖 streamlit / pymongo）
+
+UI、FastAPI 后端和 scripts/init_db.py 都需要同一套哈希格式。
+单独成模块后，脚本和后端 import 它时不会顺带把 streamlit 拉进来；
+utils.database 仍然转发导出 make_hash / check_hashes，老代码不用改。
+"""
+
+import hashlib
+import hmac
+import os
+
+# scrypt 参数：n=2**14, r=8 约占 16MB 内存、单次几十毫秒，足以拖慢离线爆破，
+# 又不会让登录明显变卡。参数写进哈希串里，以后调参不影响老用户校验。
+_SCRYPT_N = 2 ** 14
+_SCRYPT_R = 8
+_SCRYPT_P = 1
+_SCRYPT_DKLEN = 32
+_SALT_BYTES = 16
+
+
+def _scrypt(password, salt, n, r, p):
+    return hashlib.scrypt(
+        password.encode(), salt=salt, n=n, r=r, p=p,
+        maxmem=2 * 128 * r * (n + p + 2), dklen=_SCRYPT_DKLEN,
+    )
+
+
+def make_hash(password):
+    """scrypt 加密（每个用户独立随机盐）
+
+    返回格式：scrypt$n$r$p$<salt hex>$<hash hex>
+    盐和参数都放在同一个字符串里，users 集合的 password 字段不需要改结构。
+    """
+    salt = os.urandom(_SALT_BYTES)
+    digest = _scrypt(password, salt, _SCRYPT_N, _SCRYPT_R, _SCRYPT_P)
+    return f"scrypt${_SCRYPT_N}${_SCRYPT_R}${_SCRYPT_P}${salt.hex()}${digest.hex()}"
+
+def check_hashes(password, hashed_text):
+    """密码校验
+
+    兼容两种格式：
+    - 新格式 scrypt$...：按串里记录的盐和参数重新计算
+    - 老格式（64 位 SHA256 十六进制）：历史用户仍能登录
+    - None：账号不存在，做一次同等开销的哈希后返回 False
+    比较统一用 hmac.compare_digest，避免按字节提前退出带来的时序差异。
+    """
+    if not isinstance(hashed_text, str):
+        # 账号不存在（调用方传 None）时也完整算一次 scrypt 再返回 False，
+        # 让“账号不存在”和“密码错误”的响应时间一致，避免被用来枚举学号。
+        _scrypt(password, b"\0" * _SALT_BYTES, _SCRYPT_N, _SCRYPT_R, _SCRYPT_P)
+        return False
+    if hashed_text.startswith("scrypt$"):
+        try:
+            _, n, r, p, salt_hex, digest_hex = hashed_text.split("$")
+            digest = _scrypt(password, bytes.fromhex(salt_hex), int(n), int(r), int(p))
+        except ValueError:
+            return False
+        return hmac.compare_digest(digest.hex(), digest_hex)
+    legacy = hashlib.sha256(str.encode(password)).hexdigest()
+    return hmac.compare_digest(legacy, hashed_text)